@@ -0,0 +1,64 @@
+import os
+from dataclasses import dataclass
+from dotenv import load_dotenv
+
+load_dotenv()
+
+@dataclass(frozen=True, slots=True)
+class Config:
+    """Application settings, read from the environment once at startup."""
+    telegram_token: str
+    db_user: str
+    db_password: str
+    db_name: str
+    db_host: str
+    db_port: int
+    db_pool_size: int = 9
+    db_statement_timeout_ms: int = 10000
+    openai_api_key: str | None = None
+    openai_proxy_url: str | None = None
+    openai_max_concurrency: int = 8
+    yandex_folder_id: str | None = None
+    yandex_iam_token: str | None = None
+    concurrent_updates: int = 256
+    llm_timeout_analyze: float = 20.0
+    llm_timeout_feedback: float = 15.0
+    llm_timeout_recs: float = 30.0
+    webhook_url: str | None = None
+    webhook_port: int = 8443
+    webhook_secret: str | None = None
+    polling_fallback: bool = False
+    log_level: str = 'WARNING'
+
+    @classmethod
+    def load(cls) -> 'Config':
+        """Load settings from the environment, reporting all missing variables at once."""
+        required = ('TELEGRAM_TOKEN', 'DB_USER', 'DB_PASSWORD', 'DB_NAME', 'DB_HOST', 'DB_PORT')
+        missing = [name for name in required if not os.getenv(name)]
+        if missing:
+            raise ValueError(f"Required environment variables are not set: {', '.join(missing)}")
+        
+        return cls(
+            telegram_token=os.getenv('TELEGRAM_TOKEN'),
+            db_user=os.getenv('DB_USER'),
+            db_password=os.getenv('DB_PASSWORD'),
+            db_name=os.getenv('DB_NAME'),
+            db_host=os.getenv('DB_HOST'),
+            db_port=int(os.getenv('DB_PORT')),
+            db_pool_size=int(os.getenv('DB_POOL_SIZE', str((os.cpu_count() or 1) * 2 + 1))),
+            db_statement_timeout_ms=int(os.getenv('DB_STATEMENT_TIMEOUT_MS', '10000')),
+            openai_api_key=os.getenv('OPENAI_API_KEY'),
+            openai_proxy_url=os.getenv('OPENAI_PROXY_URL'),
+            openai_max_concurrency=int(os.getenv('OPENAI_MAX_CONCURRENCY', '8')),
+            yandex_folder_id=os.getenv('YANDEX_FOLDER_ID'),
+            yandex_iam_token=os.getenv('YANDEX_IAM_TOKEN'),
+            concurrent_updates=int(os.getenv('CONCURRENT_UPDATES', '256')),
+            llm_timeout_analyze=float(os.getenv('LLM_TIMEOUT_ANALYZE', '20')),
+            llm_timeout_feedback=float(os.getenv('LLM_TIMEOUT_FEEDBACK', '15')),
+            llm_timeout_recs=float(os.getenv('LLM_TIMEOUT_RECS', '30')),
+            webhook_url=os.getenv('WEBHOOK_URL') or None,
+            webhook_port=int(os.getenv('WEBHOOK_PORT', '8443')),
+            webhook_secret=os.getenv('WEBHOOK_SECRET') or None,
+            polling_fallback=os.getenv('POLLING_FALLBACK') == '1',
+            log_level=os.getenv('LOG_LEVEL', 'WARNING').upper()
+        )
@@ -1,26 +1,62 @@
-import os
 import logging
 import time
-from sqlalchemy import create_engine, func, and_, desc, text
+from sqlalchemy import create_engine, event, func, and_, case, desc, text
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.exc import OperationalError
 from datetime import datetime, timedelta
-from models import Base, User, UserGoals, Meal
-from dotenv import load_dotenv
+from models import Base, User, UserGoals, Meal, MealAnalysisCache
+from config import Config
 import re
-
-load_dotenv()
+from typing import NamedTuple
 
 logger = logging.getLogger(__name__)
 
+# Engines (and their connection pools) are shared by every Database instance
+# pointing at the same URL
+_engines = {}
+
+_HTML_TAG_RE = re.compile(r'<[^>]+>')
+
+NUTRIENTS = ('calories', 'protein', 'fat', 'carbs')
+
+def _utc_day_range(days: int = 1) -> tuple:
+    """[start, end) of the last `days` UTC days including today, as naive datetimes."""
+    end = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    return end - timedelta(days=days), end
+
+# Queries slower than this are logged with their SQL
+SLOW_QUERY_SECONDS = 0.2
+
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    # Kept on the per-statement context, so a failed statement leaves nothing behind
+    if context is not None:
+        context._query_start = time.perf_counter()
+
+def _log_slow_query(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, '_query_start', None)
+    if start is None:
+        return
+    elapsed = time.perf_counter() - start
+    if elapsed >= SLOW_QUERY_SECONDS:
+        logger.warning("Slow query (%.3fs): %s", elapsed, statement)
+
+class TodayMeal(NamedTuple):
+    description: str
+    calories: int
+    protein: float
+    fat: float
+    carbs: float
+
 class Database:
-    def __init__(self, max_retries=5, retry_delay=5):
+    def __init__(self, config: Config, max_retries=5, retry_delay=5):
         """Initialize database connection with retry logic."""
-        self.db_user = os.getenv('DB_USER')
-        self.db_password = os.getenv('DB_PASSWORD')
-        self.db_name = os.getenv('DB_NAME')
-        self.db_host = os.getenv('DB_HOST')
-        self.db_port = os.getenv('DB_PORT')
+        self.db_user = config.db_user
+        self.db_password = config.db_password
+        self.db_name = config.db_name
+        self.db_host = config.db_host
+        self.db_port = config.db_port
+        self.pool_size = config.db_pool_size
+        self.statement_timeout_ms = config.db_statement_timeout_ms
         
         # Create database URL with SSL settings
         self.db_url = f"postgresql://{self.db_user}:{self.db_password}@{self.db_host}:{self.db_port}/{self.db_name}?sslmode=require"
@@ -38,14 +74,24 @@ class Database:
         """Initialize database connection with retry logic."""
         for attempt in range(max_retries):
             try:
-                logger.info(f"Attempting to connect to database (attempt {attempt + 1}/{max_retries})")
-                self.engine = create_engine(
-                    self.db_url,
-                    pool_pre_ping=True,  # Enable connection health checks
-                    pool_recycle=3600,   # Recycle connections after 1 hour
-                    pool_size=5,         # Maximum number of connections
-                    max_overflow=10      # Maximum number of connections that can be created above pool_size
-                )
+                logger.info("Attempting to connect to database (attempt %s/%s)", attempt + 1, max_retries)
+                self.engine = _engines.get(self.db_url)
+                if self.engine is None:
+                    self.engine = create_engine(
+                        self.db_url,
+                        pool_pre_ping=True,           # Enable connection health checks
+                        pool_recycle=3600,            # Recycle connections after 1 hour
+                        pool_size=self.pool_size,     # Connections kept open, (cores * 2) + 1 by default
+                        max_overflow=self.pool_size,  # Extra connections allowed under bursts
+                        pool_timeout=3,               # Fail fast instead of queueing when saturated
+                        connect_args={
+                            # Abort runaway queries server-side
+                            'options': f'-c statement_timeout={self.statement_timeout_ms}'
+                        }
+                    )
+                    event.listen(self.engine, 'before_cursor_execute', _start_query_timer)
+                    event.listen(self.engine, 'after_cursor_execute', _log_slow_query)
+                    _engines[self.db_url] = self.engine
                 self.Session = sessionmaker(bind=self.engine)
                 
                 # Test the connection
@@ -54,9 +100,12 @@ class Database:
                 logger.info("Successfully connected to database")
                 return
             except OperationalError as e:
-                logger.error(f"Database connection error (attempt {attempt + 1}/{max_retries}): {str(e)}")
+                logger.error("Database connection error (attempt %s/%s): %s", attempt + 1, max_retries, e)
+                # Drop the shared engine so the next attempt builds a fresh pool
+                _engines.pop(self.db_url, None)
+                self.engine.dispose()
                 if attempt < max_retries - 1:
-                    logger.info(f"Retrying in {retry_delay} seconds...")
+                    logger.info("Retrying in %s seconds...", retry_delay)
                     time.sleep(retry_delay)
                 else:
                     logger.error("Failed to connect to database after all retries")
@@ -71,9 +120,9 @@ class Database:
             try:
                 return self.Session()
             except OperationalError as e:
-                logger.error(f"Session creation error (attempt {attempt + 1}/{max_retries}): {str(e)}")
+                logger.error("Session creation error (attempt %s/%s): %s", attempt + 1, max_retries, e)
                 if attempt < max_retries - 1:
-                    logger.info(f"Retrying in {retry_delay} seconds...")
+                    logger.info("Retrying in %s seconds...", retry_delay)
                     time.sleep(retry_delay)
                     # Try to reinitialize connection
                     self._initialize_connection(max_retries=1, retry_delay=1)
@@ -89,9 +138,9 @@ class Database:
             try:
                 return func(*args, **kwargs)
             except OperationalError as e:
-                logger.error(f"Database operation error (attempt {attempt + 1}/{max_retries}): {str(e)}")
+                logger.error("Database operation error (attempt %s/%s): %s", attempt + 1, max_retries, e)
                 if attempt < max_retries - 1:
-                    logger.info(f"Retrying in {retry_delay} seconds...")
+                    logger.info("Retrying in %s seconds...", retry_delay)
                     time.sleep(retry_delay)
                     # Try to reinitialize connection
                     self._initialize_connection(max_retries=1, retry_delay=1)
@@ -134,11 +183,11 @@ class Database:
                 session.add(user_goals)
             
             session.commit()
-            logger.info(f"Set goals for user {telegram_id}: {goals}")
+            logger.debug("Set goals for user %s: %s", telegram_id, goals)
             
         except Exception as e:
             session.rollback()
-            logger.error(f"Error setting goals for user {telegram_id}: {str(e)}")
+            logger.error("Error setting goals for user %s: %s", telegram_id, e)
             raise
         finally:
             session.close()
@@ -146,7 +195,7 @@ class Database:
     def _sanitize_meal_description(self, description: str) -> str:
         """Sanitize meal description to prevent XSS and other attacks."""
         # Remove HTML tags
-        description = re.sub(r'<[^>]+>', '', description)
+        description = _HTML_TAG_RE.sub('', description)
         
         # Remove potentially dangerous characters
         description = description.replace(';', '')
@@ -183,11 +232,53 @@ class Database:
             
             session.add(meal)
             session.commit()
-            logger.info(f"Saved meal for user {telegram_id}: {safe_description}")
+            logger.debug("Saved meal for user %s: %s", telegram_id, safe_description)
+            
+        except Exception as e:
+            session.rollback()
+            logger.error("Error saving meal for user %s: %s", telegram_id, e)
+            raise
+        finally:
+            session.close()
+
+    def get_cached_analysis(self, key: str) -> dict:
+        """Get a stored meal analysis by its description key."""
+        session = self._get_session()
+        try:
+            cached = session.get(MealAnalysisCache, key)
+            if not cached:
+                return None
+            
+            return {
+                'calories': cached.calories,
+                'protein': cached.protein,
+                'fat': cached.fat,
+                'carbs': cached.carbs
+            }
+            
+        except Exception as e:
+            logger.error("Error retrieving cached analysis %s: %s", key, e)
+            raise
+        finally:
+            session.close()
+
+    def save_cached_analysis(self, key: str, analysis: dict):
+        """Store a meal analysis under its description key."""
+        session = self._get_session()
+        try:
+            session.merge(MealAnalysisCache(
+                key=key,
+                calories=analysis['calories'],
+                protein=analysis['protein'],
+                fat=analysis['fat'],
+                carbs=analysis['carbs']
+            ))
+            session.commit()
+            logger.debug("Cached meal analysis %s", key)
             
         except Exception as e:
             session.rollback()
-            logger.error(f"Error saving meal for user {telegram_id}: {str(e)}")
+            logger.error("Error caching analysis %s: %s", key, e)
             raise
         finally:
             session.close()
@@ -206,71 +297,92 @@ class Database:
             if not goals:
                 return None
             
-            # Get today's meals
-            today = datetime.utcnow().date()
-            meals = session.query(Meal).filter(
+            # Sum today's meals in the database
+            day_start, day_end = _utc_day_range()
+            totals = session.query(
+                func.coalesce(func.sum(Meal.calories), 0).label('calories'),
+                func.coalesce(func.sum(Meal.protein), 0.0).label('protein'),
+                func.coalesce(func.sum(Meal.fat), 0.0).label('fat'),
+                func.coalesce(func.sum(Meal.carbs), 0.0).label('carbs')
+            ).filter(
                 and_(
                     Meal.user_id == user.id,
-                    func.date(Meal.created_at) == today
+                    # A plain range on created_at, so the (user_id, created_at) index applies
+                    Meal.created_at >= day_start,
+                    Meal.created_at < day_end
                 )
-            ).all()
-            
-            # Calculate totals
-            total_calories = sum(meal.calories for meal in meals)
-            total_protein = sum(meal.protein for meal in meals)
-            total_fat = sum(meal.fat for meal in meals)
-            total_carbs = sum(meal.carbs for meal in meals)
+            ).one()
             
             progress = {
-                'calories': total_calories,
-                'protein': total_protein,
-                'fat': total_fat,
-                'carbs': total_carbs,
+                'calories': totals.calories,
+                'protein': totals.protein,
+                'fat': totals.fat,
+                'carbs': totals.carbs,
                 'goal_calories': goals.calories,
                 'goal_protein': goals.protein,
                 'goal_fat': goals.fat,
                 'goal_carbs': goals.carbs
             }
             
-            logger.info(f"Retrieved progress for user {telegram_id}: {progress}")
+            logger.debug("Retrieved progress for user %s: %s", telegram_id, progress)
             return progress
             
         except Exception as e:
-            logger.error(f"Error retrieving progress for user {telegram_id}: {str(e)}")
+            logger.error("Error retrieving progress for user %s: %s", telegram_id, e)
             raise
         finally:
             session.close()
 
-    def get_today_meals(self, telegram_id: int) -> list:
-        """Get all meals logged today."""
+    def get_today_summary(self, telegram_id: int) -> tuple:
+        """Get today's meals and the user's progress in a single query."""
         session = self._get_session()
         try:
-            user = self._get_or_create_user(session, telegram_id)
-            
-            today = datetime.utcnow().date()
-            meals = session.query(Meal).filter(
+            day_start, day_end = _utc_day_range()
+            rows = session.query(UserGoals, Meal).select_from(User).outerjoin(
+                UserGoals, UserGoals.user_id == User.id
+            ).outerjoin(
+                Meal,
                 and_(
-                    Meal.user_id == user.id,
-                    func.date(Meal.created_at) == today
+                    Meal.user_id == User.id,
+                    # A plain range on created_at, so the (user_id, created_at) index applies
+                    Meal.created_at >= day_start,
+                    Meal.created_at < day_end
                 )
+            ).filter(
+                User.telegram_id == telegram_id
             ).order_by(Meal.created_at).all()
             
-            result = [
-                (meal.description, meal.calories, meal.protein, meal.fat, meal.carbs)
-                for meal in meals
+            meals = [
+                TodayMeal(meal.description, meal.calories, meal.protein, meal.fat, meal.carbs)
+                for _, meal in rows
+                if meal is not None
             ]
             
-            logger.info(f"Retrieved {len(result)} meals for user {telegram_id}")
-            return result
+            goals = rows[0][0] if rows else None
+            progress = None
+            if goals:
+                progress = {
+                    'calories': sum(meal.calories for meal in meals),
+                    'protein': sum(meal.protein for meal in meals),
+                    'fat': sum(meal.fat for meal in meals),
+                    'carbs': sum(meal.carbs for meal in meals),
+                    'goal_calories': goals.calories,
+                    'goal_protein': goals.protein,
+                    'goal_fat': goals.fat,
+                    'goal_carbs': goals.carbs
+                }
+            
+            logger.debug("Retrieved today's summary for user %s: %s meals", telegram_id, len(meals))
+            return meals, progress
             
         except Exception as e:
-            logger.error(f"Error retrieving today's meals for user {telegram_id}: {str(e)}")
+            logger.error("Error retrieving today's summary for user %s: %s", telegram_id, e)
             raise
         finally:
             session.close()
 
-    def get_weekly_summary(self, telegram_id: int) -> list:
-        """Get weekly calorie summary with goal achievement information."""
+    def get_weekly_summary_with_aggregates(self, telegram_id: int) -> tuple:
+        """Get weekly daily summaries with goal achievement information, plus aggregates for the week."""
         session = self._get_session()
         try:
             user = self._get_or_create_user(session, telegram_id)
@@ -281,21 +393,32 @@ class Database:
                 return None
             
             # Get date range (last 7 days)
-            end_date = datetime.utcnow().date()
-            start_date = end_date - timedelta(days=6)
+            week_start, week_end = _utc_day_range(7)
             
-            # Query daily totals with all nutritional values
+            # Query daily totals with all nutritional values, coalesced to 0
+            day_totals = {
+                nutrient: func.coalesce(func.sum(getattr(Meal, nutrient)), 0)
+                for nutrient in NUTRIENTS
+            }
+            # Weekly aggregates over the logged days, computed by the same pass:
+            # the average, days the goal was reached and days it was exceeded by more than 25%
+            aggregates = []
+            for nutrient, total in day_totals.items():
+                goal = getattr(goals, nutrient)
+                aggregates += [
+                    func.avg(total).over().label(f'avg_{nutrient}'),
+                    func.sum(case((total >= goal, 1), else_=0)).over().label(f'days_reached_{nutrient}'),
+                    func.sum(case((total * 100 > goal * 125, 1), else_=0)).over().label(f'days_exceeded_{nutrient}')
+                ]
             daily_totals = session.query(
                 func.date(Meal.created_at).label('date'),
-                func.sum(Meal.calories).label('total_calories'),
-                func.sum(Meal.protein).label('total_protein'),
-                func.sum(Meal.fat).label('total_fat'),
-                func.sum(Meal.carbs).label('total_carbs')
+                *(total.label(f'total_{nutrient}') for nutrient, total in day_totals.items()),
+                *aggregates
             ).filter(
                 and_(
                     Meal.user_id == user.id,
-                    func.date(Meal.created_at) >= start_date,
-                    func.date(Meal.created_at) <= end_date
+                    Meal.created_at >= week_start,
+                    Meal.created_at < week_end
                 )
             ).group_by(
                 func.date(Meal.created_at)
@@ -308,28 +431,42 @@ class Database:
             for day in daily_totals:
                 day_data = {
                     'date': day.date,
-                    'calories': day.total_calories or 0,
-                    'protein': day.total_protein or 0,
-                    'fat': day.total_fat or 0,
-                    'carbs': day.total_carbs or 0,
+                    'calories': day.total_calories,
+                    'protein': day.total_protein,
+                    'fat': day.total_fat,
+                    'carbs': day.total_carbs,
                     'goal_calories': goals.calories,
                     'goal_protein': goals.protein,
                     'goal_fat': goals.fat,
                     'goal_carbs': goals.carbs,
                     'reached_goals': {
-                        'calories': (day.total_calories or 0) >= goals.calories,
-                        'protein': (day.total_protein or 0) >= goals.protein,
-                        'fat': (day.total_fat or 0) >= goals.fat,
-                        'carbs': (day.total_carbs or 0) >= goals.carbs
+                        'calories': day.total_calories >= goals.calories,
+                        'protein': day.total_protein >= goals.protein,
+                        'fat': day.total_fat >= goals.fat,
+                        'carbs': day.total_carbs >= goals.carbs
                     }
                 }
                 result.append(day_data)
             
-            logger.info(f"Retrieved weekly summary for user {telegram_id}")
-            return result
+            if daily_totals:
+                first_day = daily_totals[0]
+                week = {
+                    'averages': {n: float(getattr(first_day, f'avg_{n}')) for n in NUTRIENTS},
+                    'days_reached': {n: getattr(first_day, f'days_reached_{n}') for n in NUTRIENTS},
+                    'days_exceeded': {n: getattr(first_day, f'days_exceeded_{n}') for n in NUTRIENTS}
+                }
+            else:
+                week = {
+                    'averages': dict.fromkeys(NUTRIENTS, 0),
+                    'days_reached': dict.fromkeys(NUTRIENTS, 0),
+                    'days_exceeded': dict.fromkeys(NUTRIENTS, 0)
+                }
+            
+            logger.debug("Retrieved weekly summary for user %s", telegram_id)
+            return result, week
             
         except Exception as e:
-            logger.error(f"Error retrieving weekly summary for user {telegram_id}: {str(e)}")
+            logger.error("Error retrieving weekly summary for user %s: %s", telegram_id, e)
             raise
         finally:
             session.close() 
\ No newline at end of file
@@ -1,33 +1,88 @@
-import os
+import re
 import json
+import asyncio
+import hashlib
 import httpx
-from dotenv import load_dotenv
 import logging
-
-load_dotenv()
+from config import Config
 
 logger = logging.getLogger(__name__)
 
+_PUNCTUATION_RE = re.compile(r'[^\w\s]')
+_WHITESPACE_RE = re.compile(r'\s+')
+
+# Structured output for the combined analysis + feedback request
+_MEAL_FEEDBACK_SCHEMA = {
+    "name": "meal_feedback",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "analysis": {
+                "type": "object",
+                "properties": {
+                    "calories": {"type": "number"},
+                    "protein": {"type": "number"},
+                    "fat": {"type": "number"},
+                    "carbs": {"type": "number"}
+                },
+                "required": ["calories", "protein", "fat", "carbs"],
+                "additionalProperties": False
+            },
+            "feedback": {"type": "string"}
+        },
+        "required": ["analysis", "feedback"],
+        "additionalProperties": False
+    }
+}
+
+def normalize_meal_description(description: str) -> str:
+    """Normalize a meal description so equivalent phrasings compare equal."""
+    description = _PUNCTUATION_RE.sub(' ', description.lower())
+    return _WHITESPACE_RE.sub(' ', description).strip()
+
+def meal_cache_key(description: str) -> str:
+    """Build the analysis cache key for a meal description."""
+    return hashlib.sha1(normalize_meal_description(description).encode('utf-8')).hexdigest()
+
+# Instructions for the combined analysis + feedback request; only the meal and
+# the day's totals go in the user message
+_MEAL_FEEDBACK_SYSTEM_PROMPT = (
+    "Вы - эксперт по питанию. Пользователь присылает описание приема пищи и свои дневные итоги "
+    "до этого приема пищи. Ответ состоит из двух полей.\n"
+    "analysis - питательная ценность этого приема пищи: calories (калории), protein (белки в граммах), "
+    "fat (жиры в граммах), carbs (углеводы в граммах). Будьте максимально точны в оценках, учитывайте "
+    "типичные размеры порций и распространенные ингредиенты.\n"
+    "feedback - краткий, дружелюбный отзыв на русском языке с учетом дневных целей:\n"
+    "1. Если прием пищи превышает 30% от оставшихся дневных калорий, укажите на это и дайте рекомендации по уменьшению порции\n"
+    "2. Если белки/жиры/углеводы значительно превышают оставшиеся нормы, предложите более сбалансированные варианты\n"
+    "3. Укажите, на основе какого размера порции был сделан расчет (например, 'стандартная порция', 'средняя тарелка', 'примерно 200г')\n"
+    "4. Если прием пищи хорошо сбалансирован и вписывается в нормы, похвалите выбор\n"
+    "Будьте краткими и ободряющими, даже если нужно указать на превышение норм."
+)
+
+# Identical on every recommendations request, so it forms a stable prompt prefix
+_RECOMMENDATIONS_SYSTEM_PROMPT = (
+    "Вы - помощник по питанию. Предоставляйте конкретные, практичные рекомендации на основе "
+    "текущего состояния питания пользователя и оставшихся дневных целей. "
+    "Предоставьте 2-3 конкретных, практичных рекомендации для следующего приема пищи или перекуса "
+    "на основе оставшихся дневных целей. Сосредоточьтесь на практических предложениях, которые помогут "
+    "достичь целей. Будьте краткими и дружелюбными. Отвечайте на русском языке."
+)
+
 class FoodAnalyzer:
-    def __init__(self):
-        self.api_key = os.getenv('OPENAI_API_KEY')
-        self.proxy_url = os.getenv('OPENAI_PROXY_URL')
-        self.system_prompt = """Вы - эксперт по питанию. Ваша задача - анализировать описания еды и предоставлять точную информацию о питательной ценности.
-        Для каждого описания еды предоставьте:
-        1. Общее количество калорий
-        2. Белки в граммах
-        3. Жиры в граммах
-        4. Углеводы в граммах
-        
-        Будьте максимально точны в своих оценках. Учитывайте типичные размеры порций и распространенные ингредиенты.
-        Возвращайте ответ в формате JSON со следующей структурой:
-        {
-            "calories": число,
-            "protein": число,
-            "fat": число,
-            "carbs": число
-        }
-        """
+    def __init__(self, config: Config):
+        self.api_key = config.openai_api_key
+        self.proxy_url = config.openai_proxy_url
+        # Cap concurrent OpenAI requests to stay within the API rate limit
+        self.request_semaphore = asyncio.Semaphore(config.openai_max_concurrency)
+        # One pooled client for all requests so keep-alive connections are reused
+        self._http = httpx.AsyncClient(
+            proxies=self.proxy_url,
+            verify=False,  # Only disable SSL verification for proxy
+            limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+            timeout=httpx.Timeout(30.0, connect=5.0, write=10.0, pool=5.0)
+        )
 
     async def _make_request(self, payload: dict) -> dict:
         """Make a request to OpenAI API with proxy support."""
@@ -37,82 +92,87 @@ class FoodAnalyzer:
         }
 
         try:
-            with httpx.Client(
-                proxies=self.proxy_url,
-                timeout=30.0,
-                verify=False  # Only disable SSL verification for proxy
-            ) as client:
-                response = client.post(
+            async with self.request_semaphore:
+                response = await self._http.post(
                     "https://api.openai.com/v1/chat/completions",
                     headers=headers,
-                    json=payload,
-                    timeout=30.0
+                    json=payload
                 )
-                response.raise_for_status()
-                return response.json()
+            response.raise_for_status()
+            return response.json()
         except httpx.HTTPError as e:
-            logger.error(f"HTTP error occurred: {str(e)}")
+            logger.error("HTTP error occurred: %s", e)
             raise
         except Exception as e:
-            logger.error(f"Error making request: {str(e)}")
+            logger.error("Error making request: %s", e)
             raise
 
-    async def analyze_meal(self, description: str) -> dict:
-        """Analyze a meal description and return nutritional information."""
+    async def aclose(self):
+        """Close the pooled HTTP client."""
+        await self._http.aclose()
+
+    async def get_feedback(self, prompt: str) -> str:
+        """Generate feedback about a meal using the LLM."""
         try:
-            logger.info(f"Analyzing meal description: {description}")
+            logger.debug("Generating feedback with prompt: %s", prompt)
             
             payload = {
                 "model": "gpt-4o-mini",
                 "messages": [
-                    {"role": "system", "content": self.system_prompt},
-                    {"role": "user", "content": f"Analyze this meal: {description}"}
+                    {"role": "system", "content": "Вы - помощник по питанию. Давайте краткие, дружелюбные отзывы о приемах пищи в контексте дневных целей. Будьте ободряющими и практичными. Отвечайте на русском языке."},
+                    {"role": "user", "content": prompt}
                 ],
-                "response_format": {"type": "json_object"}
+                "temperature": 0.7,
+                "max_tokens": 500
             }
             
             response = await self._make_request(payload)
-            result = response['choices'][0]['message']['content']
-            logger.info(f"LLM analysis response: {result}")
-            
-            return json.loads(result)
+            feedback = response['choices'][0]['message']['content'].strip()
+            logger.debug("LLM feedback response: %s", feedback)
+            return feedback
             
         except Exception as e:
-            logger.error(f"Error analyzing meal: {str(e)}")
-            return {
-                "calories": 0,
-                "protein": 0,
-                "fat": 0,
-                "carbs": 0
-            }
+            logger.error("Error generating feedback: %s", e)
+            return "К сожалению, я не смог сгенерировать конкретный отзыв в данный момент, но ваш прием пищи был успешно сохранен!"
 
-    async def get_feedback(self, prompt: str) -> str:
-        """Generate feedback about a meal using the LLM."""
+    async def analyze_and_feedback(self, description: str, progress_data: dict) -> dict:
+        """Analyze a meal and write feedback on it in a single LLM request."""
         try:
-            logger.info(f"Generating feedback with prompt: {prompt}")
+            prompt = (
+                f"{description}\n\n"
+                f"Дневные итоги до этого приема пищи: "
+                f"калории {progress_data['calories']}/{progress_data['goal_calories']}, "
+                f"белки {progress_data['protein']}/{progress_data['goal_protein']}г, "
+                f"жиры {progress_data['fat']}/{progress_data['goal_fat']}г, "
+                f"углеводы {progress_data['carbs']}/{progress_data['goal_carbs']}г."
+            )
+            
+            logger.debug("Analyzing meal with feedback, prompt: %s", prompt)
             
             payload = {
                 "model": "gpt-4o-mini",
                 "messages": [
-                    {"role": "system", "content": "Вы - помощник по питанию. Давайте краткие, дружелюбные отзывы о приемах пищи в контексте дневных целей. Будьте ободряющими и практичными. Отвечайте на русском языке."},
+                    {"role": "system", "content": _MEAL_FEEDBACK_SYSTEM_PROMPT},
                     {"role": "user", "content": prompt}
                 ],
-                "temperature": 0.7,
-                "max_tokens": 500
+                "response_format": {"type": "json_schema", "json_schema": _MEAL_FEEDBACK_SCHEMA},
+                "max_tokens": 700
             }
             
             response = await self._make_request(payload)
-            feedback = response['choices'][0]['message']['content'].strip()
-            logger.info(f"LLM feedback response: {feedback}")
-            return feedback
+            result = response['choices'][0]['message']['content']
+            logger.debug("LLM analysis with feedback response: %s", result)
+            
+            return json.loads(result)
             
         except Exception as e:
-            logger.error(f"Error generating feedback: {str(e)}")
-            return "К сожалению, я не смог сгенерировать конкретный отзыв в данный момент, но ваш прием пищи был успешно сохранен!"
+            logger.error("Error analyzing meal with feedback: %s", e)
+            raise
 
     async def get_recommendations(self, progress_data: dict, remaining: dict) -> str:
         """Generate personalized nutrition recommendations using the LLM."""
         try:
+            # Only the numbers vary; the instructions stay in the fixed system prompt
             prompt = (
                 f"Текущее дневное питание пользователя:\n"
                 f"Калории: {progress_data['calories']}/{progress_data['goal_calories']}\n"
@@ -123,18 +183,15 @@ class FoodAnalyzer:
                 f"Калории: {remaining['calories']}\n"
                 f"Белки: {remaining['protein']}г\n"
                 f"Жиры: {remaining['fat']}г\n"
-                f"Углеводы: {remaining['carbs']}г\n\n"
-                "Предоставьте 2-3 конкретных, практичных рекомендации для следующего приема пищи или перекуса "
-                "на основе оставшихся дневных целей. Сосредоточьтесь на практических предложениях, которые помогут "
-                "достичь целей. Будьте краткими и дружелюбными. Отвечайте на русском языке."
+                f"Углеводы: {remaining['carbs']}г"
             )
             
-            logger.info(f"Generating recommendations with prompt: {prompt}")
+            logger.debug("Generating recommendations with prompt: %s", prompt)
             
             payload = {
                 "model": "gpt-4o-mini",
                 "messages": [
-                    {"role": "system", "content": "Вы - помощник по питанию. Предоставляйте конкретные, практичные рекомендации на основе текущего состояния питания пользователя и оставшихся дневных целей. Отвечайте на русском языке."},
+                    {"role": "system", "content": _RECOMMENDATIONS_SYSTEM_PROMPT},
                     {"role": "user", "content": prompt}
                 ],
                 "temperature": 0.7,
@@ -143,12 +200,12 @@ class FoodAnalyzer:
             
             response = await self._make_request(payload)
             recommendations = response['choices'][0]['message']['content'].strip()
-            logger.info(f"LLM recommendations response: {recommendations}")
+            logger.debug("LLM recommendations response: %s", recommendations)
             return recommendations
             
         except Exception as e:
-            logger.error(f"Error generating recommendations: {str(e)}")
-            return "К сожалению, я не смог сгенерировать конкретные рекомендации в данный момент. Пожалуйста, попробуйте позже!"
+            logger.error("Error generating recommendations: %s", e)
+            raise
 
     async def get_llm_response(self, prompt: str) -> str:
         """Get response from LLM for a given prompt."""
@@ -164,5 +221,5 @@ class FoodAnalyzer:
             })
             return response['choices'][0]['message']['content']
         except Exception as e:
-            logger.error(f"Error getting LLM response: {str(e)}")
+            logger.error("Error getting LLM response: %s", e)
             raise 
\ No newline at end of file
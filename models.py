@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, ForeignKey
+from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, ForeignKey, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from datetime import datetime
@@ -44,4 +44,19 @@ class Meal(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     
     # Relationship
-    user = relationship("User", back_populates="meals") 
\ No newline at end of file
+    user = relationship("User", back_populates="meals")
+    
+    # Per-user date range scans (today, weekly summary)
+    __table_args__ = (
+        Index('ix_meals_user_id_created_at', 'user_id', 'created_at'),
+    )
+
+class MealAnalysisCache(Base):
+    __tablename__ = 'meal_analysis_cache'
+    
+    key = Column(String(40), primary_key=True)
+    calories = Column(Integer, nullable=False)
+    protein = Column(Float, nullable=False)
+    fat = Column(Float, nullable=False)
+    carbs = Column(Float, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
@@ -1,17 +1,14 @@
-import os
 import json
 import logging
 import requests
-from dotenv import load_dotenv
-
-load_dotenv()
+from config import Config
 
 logger = logging.getLogger(__name__)
 
 class SpeechRecognizer:
-    def __init__(self):
-        self.folder_id = os.getenv('YANDEX_FOLDER_ID')
-        self.iam_token = os.getenv('YANDEX_IAM_TOKEN')
+    def __init__(self, config: Config):
+        self.folder_id = config.yandex_folder_id
+        self.iam_token = config.yandex_iam_token
         self.api_url = 'https://stt.api.cloud.yandex.net/speech/v1/stt:recognize'
         
         if not self.folder_id or not self.iam_token:
@@ -52,14 +49,14 @@ class SpeechRecognizer:
                 if 'result' in result:
                     return result['result']
                 else:
-                    logger.error(f"Recognition failed: {result}")
+                    logger.error("Recognition failed: %s", result)
                     return ""
             else:
-                logger.error(f"API request failed with status {response.status_code}: {response.text}")
+                logger.error("API request failed with status %s: %s", response.status_code, response.text)
                 return ""
                 
         except Exception as e:
-            logger.error(f"Error during speech recognition: {str(e)}")
+            logger.error("Error during speech recognition: %s", e)
             return ""
 
     async def is_speech_quality_good(self, audio_data: bytes) -> bool:
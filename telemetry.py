@@ -1,4 +1,7 @@
+import queue
+import atexit
 import logging
+from logging.handlers import QueueHandler, QueueListener
 from pythonjsonlogger import jsonlogger
 from opentelemetry import trace
 from opentelemetry.sdk.trace import TracerProvider
@@ -6,23 +9,27 @@ from opentelemetry.sdk.resources import Resource
 from opentelemetry.instrumentation.sqlalchemy import SQLAlchemyInstrumentor
 from opentelemetry.instrumentation.requests import RequestsInstrumentor
 from prometheus_client import start_http_server, Counter
-import os
 
 # Настройка JSON логирования
-def setup_logging():
+def setup_logging(level: str = 'WARNING'):
     logger = logging.getLogger()
     logHandler = logging.StreamHandler()
     formatter = jsonlogger.JsonFormatter(
         fmt='%(asctime)s %(levelname)s %(name)s %(message)s'
     )
     logHandler.setFormatter(formatter)
-    logger.addHandler(logHandler)
-    logger.setLevel(logging.INFO)
+    logger.setLevel(level)
     
     # Добавляем файловый handler
     file_handler = logging.FileHandler('bot.log')
     file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
+    
+    # Запись в поток и файл выполняется в отдельном потоке, а не в event loop
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, logHandler, file_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    logger.addHandler(QueueHandler(log_queue))
     
     return logger
 
@@ -65,8 +72,8 @@ def setup_instrumentation():
     RequestsInstrumentor().instrument()
 
 def init_telemetry():
-    """Инициализация всей телеметрии"""
-    logger = setup_logging()
+    """Инициализация всей телеметрии (логирование настраивается заранее через setup_logging)"""
+    logger = logging.getLogger()
     tracer = setup_tracing()
     meal_counter, goal_counter, user_counter = setup_metrics()
     setup_instrumentation()